@@ -39,6 +39,10 @@ Offset  Value           Structure       Comment
 The last item is the one that we are after as then then make an TCP connection
 to port 6500 on that address for all further communications.
 
+The weather station details are saved (see the 'cache_file' setting) so that the next
+connection can go straight to the saved address, only falling back to the broadcast if
+the weather station does not answer there.
+
 All packets have the same basic structure: the 8-byte (null terminated) sending
 device name, the 8 byte command (READ - sent to the weather station requesting
 data; WRITE - the response from the wreather station with the requested data)
@@ -86,26 +90,26 @@ The main data packet that is fetched is the NOWRECORD and it has the following s
 
 Offset  Value       Structure   Comment
 0x20    unknown     8 bytes     Yet to be deciphered
-0x28    Wind dir    2 bytes     Wind direction (in degrees from North = 0) [4]
-0x2a    inHumidity  1 byte      Inside humidity [5]
-0x2b    outHumidity 1 byte      Outside humidity [6]
-0x2c    inTemp      4 bytes     Inside temperature (floating point) [7]
-0x30    pressure    4 bytes     Relative pressure (floating point) [8]
-0x34    barometer   4 bytes     Absolute pressure (floating point) [9]
-0x38    outTemp     4 bytes     Outside temperature (floating point) [10]
-0x3c    dewPoint    4 bytes     Dew Point tempperature (floating point) [11]
-0x40    windChill   4 bytes     Wind Chill temperature (floating point) [12]
-0x44    windSpeed   4 bytes     Wind speed (floating point) [13]
-0x48    windGust    4 bytes     Wind Gust (floating point) [14]
-0x4c    rainRate    4 bytes     Rain rate (floating point) [15]
-0x50    dailyRain   4 bytes     Daily rain (floating point) [16]
-0x54    weeklyRain  4 bytes     Weekly rain (floating point) [17]
-0x58    monthlyRain 4 bytes     Monthly rain (floating point) [18]
-0x5c    yearlyRain  4 bytes     Yearly rain (floating point) [19]
-0x60    radiation   4 bytes     Current solar radiation(floating point) [20]
-0x64    UVI         1 byte      UV Index [21]
-0x65                1 bytes     Unknown [22]
-0x66                2 bytes     Unkonwn [23]
+0x28    Wind dir    2 bytes     Wind direction (in degrees from North = 0) [0]
+0x2a    inHumidity  1 byte      Inside humidity [1]
+0x2b    outHumidity 1 byte      Outside humidity [2]
+0x2c    inTemp      4 bytes     Inside temperature (floating point) [3]
+0x30    pressure    4 bytes     Relative pressure (floating point) [4]
+0x34    barometer   4 bytes     Absolute pressure (floating point) [5]
+0x38    outTemp     4 bytes     Outside temperature (floating point) [6]
+0x3c    dewPoint    4 bytes     Dew Point tempperature (floating point) [7]
+0x40    windChill   4 bytes     Wind Chill temperature (floating point) [8]
+0x44    windSpeed   4 bytes     Wind speed (floating point) [9]
+0x48    windGust    4 bytes     Wind Gust (floating point) [10]
+0x4c    rainRate    4 bytes     Rain rate (floating point) [11]
+0x50    dailyRain   4 bytes     Daily rain (floating point) [12]
+0x54    weeklyRain  4 bytes     Weekly rain (floating point) [13]
+0x58    monthlyRain 4 bytes     Monthly rain (floating point) [14]
+0x5c    yearlyRain  4 bytes     Yearly rain (floating point) [15]
+0x60    radiation   4 bytes     Current solar radiation(floating point) [16]
+0x64    UVI         1 byte      UV Index [17]
+0x65                1 bytes     Unknown [18]
+0x66                2 bytes     Unkonwn [19]
 
 
 When the driver starts up, it checks to see if the weather station has data
@@ -136,8 +140,14 @@ having 0 records. Whether this is a bug or not, this is now treated as a special
 estimate of the number of records is made based on the 'day of the year' the catchup is occurring.
 
 From the timestamp of the last known good Weewx record, the driver finds the corresponding
-year index and then the record number. It does a binary search through the history data
-records (retrieving one at a time) until it finds a record that "matches".
+year index and then the record number. It does a search through the history data
+records until it finds a record that "matches". Each record that is examined costs a
+network round trip so several records (the 'history_pipeline' setting) are requested
+before waiting for any of the responses and the range is narrowed down using all of them.
+As the records are (normally) 5 minutes apart, the dates of the records already examined
+are used to estimate where the match will be and some of the requests are placed there
+(an interpolation search) while the rest are spread evenly over the range in case there
+are gaps in the records.
 
 Matching here is a bit complex in that it is not likely that the Weewx timestamp will
 correspond to any weather station record. Therefor the binary search ends when the
@@ -184,6 +194,7 @@ Offset  Value       Structure   Comment
 
 """
 
+import calendar
 import math
 import time
 import datetime
@@ -191,7 +202,6 @@ import datetime
 import weedb
 import weewx.drivers
 import weeutil.weeutil
-from weewx.units import convertStd
 from weeutil.weeutil import timestamp_to_string
 
 from signal import signal, SIGPIPE, SIG_DFL
@@ -199,9 +209,11 @@ from signal import signal, SIGPIPE, SIG_DFL
 #import syslog
 import logging
 import sys
+import random
 import socket
 import struct
-import select
+import selectors
+import json
 
 
 DRIVER_NAME = "HP1000"
@@ -210,30 +222,141 @@ DRIVER_VERSION = "2.0"
 UDP_BROADCAST_PORT = 6000
 TCP_PORT = 6500
 
+DEFAULT_CACHE_FILE = '/var/lib/weewx/hp1000_cache.json'
+
+# Pre-compiled layouts of the SETUP and NOWRECORD response payloads that follow
+# the header (see the module documentation for the field details)
+_PAYLOAD_OFFSET = 0x28
+_SETUP_PAYLOAD = struct.Struct("<15b")
+_SETUP_PACKET_SIZE = _PAYLOAD_OFFSET + _SETUP_PAYLOAD.size
+_NOW_PAYLOAD = struct.Struct("<hbb14fbbh")
+_NOW_PACKET_SIZE = _PAYLOAD_OFFSET + _NOW_PAYLOAD.size
+# The HISTORY_DATA response header up to and including the packet length
+_HISTORY_HEADER_SIZE = 36
+# Pre-compiled layouts of the history commands, responses and their fields
+_HISTORY_FILE_CMD = struct.pack('<8s8s16s2i', b'PC2000', b'READ', b'HISTORY_FILE', 40, 0)
+_HISTORY_FILE = struct.Struct('<8s8s16s4h8H8I')
+_HISTORY_YEAR = struct.Struct('<H')
+_HISTORY_RECORD_COUNT = struct.Struct('<I')
+# The HISTORY_DATA command only differs in the arguments at the end so it is
+# built by filling them into a copy of a template
+_HISTORY_DATA_ARGS = struct.Struct('<i2hi')
+_HISTORY_DATA_CMD = struct.pack('<8s8s16si', b'PC2000', b'READ', b'HISTORY_DATA', 48) + \
+    bytes(_HISTORY_DATA_ARGS.size)
+_HISTORY_DATA_ARGS_OFFSET = len(_HISTORY_DATA_CMD) - _HISTORY_DATA_ARGS.size
+_PACKET_LENGTH = struct.Struct('<I')
+_HISTORY_RECORD = struct.Struct('<Q12h7I')
+_HISTORY_TIMESTAMP = struct.Struct('<Q')
+_HISTORY_RAIN = struct.Struct('<i')
+# The history record times are in 100ns intervals since 1/1/1601 (local time)
+_STATION_TIME_UNITS_PER_SECOND = 10000000
+_EPOCH_1601_TO_1970 = 11644473600
+# The archive record fields taken directly from the HISTORY_DATA record values as
+# (packet key, record index, 'no data' value, divisor)
+# A divisor of None means the value is used as it is
+_HISTORY_FIELDS = (('inTemp', 1, 32767, 10.0),
+                   ('inHumidity', 2, 32767, None),
+                   ('pressure', 3, 32767, 10.0),
+                   ('barometer', 4, 32767, 10.0),
+                   ('outTemp', 5, 32767, 10.0),
+                   ('outHumidity', 6, 127, None),
+                   ('dewPoint', 7, 32767, 10.0),
+                   ('windchill', 8, 32767, 10.0),
+                   # [9] / 10.0 might be 'heatIndex'
+                   ('windSpeed', 10, 32767, 10.0),
+                   ('windGust', 11, 32767, 10.0),
+                   ('windDir', 12, 32767, None),
+                   # [13] is the 'rain rate'
+                   ('radiation', 19, 2147483647, 1267.0))    # 126.7 lux/(w/m^2)
+# Upper limit (in seconds) of the wait between network retries, unless 'retry_wait' is longer
+_MAX_RETRY_WAIT = 30
+# Size of the TCP socket send and receive buffers
+_SOCKET_BUFFER_SIZE = 1 << 17
+# The number of records read with each HISTORY_DATA request. The start record search
+# also reads all of the remaining records in one request once there are this few
+_HISTORY_BATCH_SIZE = 16
+# The LOOP packet fields taken directly from the NOWRECORD payload values as
+# (packet key, NOWRECORD index, 'no data' limit, unit group)
+# A value at or above the limit means the sensor has no data
+_NOW_FIELDS = (('windDir', 0, 32767, None),
+               ('inHumidity', 1, float('inf'), None),    # Never flagged as no data
+               ('outHumidity', 2, 127, None),
+               ('inTemp', 3, 3276, 'temperature'),
+               ('pressure', 4, 3276, 'pressure'),
+               ('barometer', 5, 3276, 'pressure'),
+               ('outTemp', 6, 3276, 'temperature'),
+               ('dewPoint', 7, 3276, 'temperature'),
+               ('windChill', 8, 3276, 'temperature'),
+               ('windSpeed', 9, 3276, 'wind'),
+               ('windGust', 10, 3276, 'wind'),
+               ('radiation', 16, 2147480, 'solar'))
+
+# (scale, offset) pairs to convert the values sent in the units selected on the
+# console 'Setup' screen to METRICWX, indexed by the unit code in the SETUP packet
+_TEMPERATURE_CONVERSIONS = {0: (1.0, 0.0),                  # Celsius
+                            1: (5.0 / 9.0, -160.0 / 9.0)}   # Fahrenheit
+_PRESSURE_CONVERSIONS = {0: (1.0, 0.0),                     # hPa
+                         1: (33.8639, 0.0),                 # inHg
+                         2: (1.333224, 0.0)}                # mmHg
+_WIND_CONVERSIONS = {0: (1.0, 0.0),                         # m/s
+                     1: (1.0 / 3.6, 0.0),                   # km/h
+                     2: (0.514444, 0.0),                    # knots
+                     3: (0.44704, 0.0),                     # mph
+                     4: (1.0, 0.0),                         # Beaufort (approximated to m/s first)
+                     5: (0.3048, 0.0)}                      # ft/s
+_RAIN_CONVERSIONS = {0: (1.0, 0.0),                         # mm
+                     1: (25.4, 0.0)}                        # in
+# Weewx does not have a standard for Lux or foot-candles
+_SOLAR_CONVERSIONS = {0: (4.02, 0.0),                       # Lux to w/m2 for sunlight
+                      1: (0.04358, 0.0),                    # fc to photons (0.199) to w/m2 (0.219)
+                      2: (1.0, 0.0)}                        # w/m2
+
+
+def _build_cmd_packet(cmd, argument):
+    """Create the complete (null padded) 40 byte command packet"""
+    return (b'PC2000'.ljust(8, b'\0') +
+            cmd.encode('utf-8').ljust(8, b'\0') +
+            argument.encode('utf-8').ljust(12, b'\0')).ljust(40, b'\0')
+
+
+def _station_local_time(station_time):
+    """Convert a history record time to local time in seconds since 1/1/1970"""
+    return station_time // _STATION_TIME_UNITS_PER_SECOND - _EPOCH_1601_TO_1970
+
+
+def _decode_field(field):
+    """Decode a null terminated text field from the weather station"""
+    return field.split(b'\0', 1)[0].decode('ascii', 'replace')
+
+
+# The command packets are fixed so build the ones that are sent regularly once
+_CMD_CACHE = {(cmd, argument): _build_cmd_packet(cmd, argument)
+              for cmd, argument in [('READ', 'NOWRECORD'), ('READ', 'SETUP')]}
+
+
+class StationPacketError(socket.error):
+    """The weather station closed the connection or sent a packet that is not
+    the response that was expected"""
+
 
 def loader(config_dict, _):
     station = HP1000Driver(**config_dict[DRIVER_NAME])
     return station
 
 
-def logmsg(level, msg):
-#    syslog.syslog(level, 'HP1000: %s' % (msg))
-    logging.log(level, 'HP1000: %s', msg);
+log = logging.getLogger(__name__)
 
 
 def logdbg(msg):
-#    logmsg(syslog.LOG_DEBUG, msg)
-    logmsg(logging.DEBUG, msg)
+    log.debug('HP1000: %s', msg)
 
 
 def loginf(msg):
-#    logmsg(syslog.LOG_ERR, msg)
-    logmsg(logging.INFO, msg)
+    log.info('HP1000: %s', msg)
 
 
 def logerr(msg):
-#    logmsg(syslog.LOG_ERR, msg)
-    logmsg(logging.ERROR, msg)
+    log.error('HP1000: %s', msg)
 
 
 class HP1000Driver(weewx.drivers.AbstractDevice):
@@ -271,9 +394,11 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
         self.loop_delay = float(stn_dict.get('loop_delay', None))
         self.retry_wait = int(stn_dict.get('retry_wait', 5))
         self.max_retry = int(stn_dict.get('max_retry', 3))
+        self.history_pipeline = max(int(stn_dict.get('history_pipeline', 4)), 1)
+        self.cache_file = stn_dict.get('cache_file', DEFAULT_CACHE_FILE) or None
 
         self.last_rain_value = None
-        self.last_rain_time = None
+        self.last_rain_day = None
 
         loginf('Address Mask = %s' % self.ip_address_mask)
         loginf('Retry count = %f' % self.retry_count)
@@ -284,146 +409,260 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
             loginf('Loop delay = %f' % self.loop_delay)
         loginf('Retry Wait = %f' % self.retry_wait)
         loginf('Max Retry = %f' % self.max_retry)
+        loginf('History pipeline = %d' % self.history_pipeline)
+        loginf('Cache file = %s' % self.cache_file)
 
         # Show that we are not connected to a weather station
         self.ws_socket = None
-
-    def string_to_null_padded(self, source, max_length, padd_char='\0'):
-        # Create a byte array
-        passed_string = source.ljust(max_length, '\0')
-        return passed_string
+        # Used to wait for data from the weather station
+        self._selector = selectors.DefaultSelector()
+        # Reusable buffer for the packets received from the weather station
+        self._rx_buf = bytearray(4096)
+        self._rx_view = memoryview(self._rx_buf)
+        # The year and record number found by the last start record search
+        self._start_record_hint = None
+        # The weather station found the last time the driver ran
+        self.station_cache = self.readStationCache()
+        # The local half hour (and its timestamp) last used to convert a weather station time
+        self._timestamp_half_hour = None
+        self._half_hour_timestamp = None
 
     def create_cmd_string(self, cmd="READ", argument="NOWRECORD"):
-        # Create the complete packet
-        cmd_packet = '{0:<8s}{1:<8s}{2:<12s}'.format(
-            self.string_to_null_padded('PC2000', 8),
-            self.string_to_null_padded(cmd, 8),
-            self.string_to_null_padded(argument, 12))
-        cmd_packet = self.string_to_null_padded(cmd_packet, 40)
-
-        return cmd_packet.encode('utf-8')
-
-    def convert_units(self, source, target):
-        """Suppress errors when the conversion cannot occcur
-        such as when the source and target unit are the same - it happens a lot
-        in this code"""
+        # Use the prebuilt packet where there is one
+        cmd_packet = _CMD_CACHE.get((cmd, argument))
+        if cmd_packet is None:
+            cmd_packet = _build_cmd_packet(cmd, argument)
+        return cmd_packet
+
+    def set_unit_conversions(self):
+        """Look up the (scale, offset) pairs that convert the values in the units
+        selected on the console to METRICWX. Unknown unit codes fall back to
+        the last unit in each table"""
+        self._temp_to_C = _TEMPERATURE_CONVERSIONS.get(self.temperature_unit,
+                                                       _TEMPERATURE_CONVERSIONS[1])
+        self._press_to_hPa = _PRESSURE_CONVERSIONS.get(self.pressure_unit,
+                                                       _PRESSURE_CONVERSIONS[2])
+        self._wind_to_mps = _WIND_CONVERSIONS.get(self.wind_unit, _WIND_CONVERSIONS[5])
+        if self.wind_unit == 4:
+            loginf('Beaufort Wind Scale Used - Using Approximation')
+        self._rain_to_mm = _RAIN_CONVERSIONS.get(self.rain_unit, _RAIN_CONVERSIONS[1])
+        self._solar_to_wm2 = _SOLAR_CONVERSIONS.get(self.solar_unit, _SOLAR_CONVERSIONS[2])
+        # Resolve the conversion for each of the _NOW_FIELDS. Beaufort values
+        # cannot be converted linearly so those fields are kept separately
+        conversions = {None: (1, 0),
+                       'temperature': self._temp_to_C,
+                       'pressure': self._press_to_hPa,
+                       'wind': self._wind_to_mps,
+                       'solar': self._solar_to_wm2}
+        beaufort = self.wind_unit == 4
+        self._field_spec = tuple((key, index, limit) + conversions[group]
+                                 for key, index, limit, group in _NOW_FIELDS
+                                 if not (beaufort and group == 'wind'))
+        self._beaufort_spec = tuple((key, index, limit)
+                                    for key, index, limit, group in _NOW_FIELDS
+                                    if beaufort and group == 'wind')
+
+    def retryWait(self, attempt):
+        """Wait before accessing the network again. The wait doubles for each
+        failed attempt, up to a limit, and is randomised so that drivers on the
+        same network do not all retry together. It is never less than 'retry_wait'"""
+        wait = self.retry_wait * 2 ** (attempt - 1) * (1.0 + random.random() * 0.5)
+        time.sleep(min(max(_MAX_RETRY_WAIT, self.retry_wait), wait))
+
+    def configureSocket(self, sock):
+        sock.settimeout(self.socket_timeout)
+        # The traffic is small request/response packets so don't let
+        # Nagle's algorithm hold back the requests
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Leave room for the history records to queue up while they are processed
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, _SOCKET_BUFFER_SIZE)
+        # The reads wait for the data with the selector
+        self._selector.register(sock, selectors.EVENT_READ)
+
+    def closeConnection(self):
+        self._selector.unregister(self.ws_socket)
+        self.ws_socket.close()
+        self.ws_socket = None
+
+    def connectDirect(self, ip_address):
+        """Try to open a TCP connection to the weather station at a known address.
+        Returns the connected socket or None"""
+        try:
+            sock = socket.create_connection((ip_address, TCP_PORT), self.socket_timeout)
+        except socket.error as e:
+            loginf('Could not connect to {0}: {1}'.format(ip_address, e))
+            return None
+        loginf('Connected to address {0}'.format(ip_address))
+        self.configureSocket(sock)
+        if self.station_cache is not None and self.station_cache.get('ip_address') == ip_address:
+            self.ws_name = self.station_cache.get('name', self.ws_name)
+            self.ws_MAC_address = self.station_cache.get('mac_address')
+            self.ws_IP_address = ip_address
+        return sock
+
+    def readStationCache(self):
+        """Read the details of the weather station found the last time the driver ran"""
+        if self.cache_file is None:
+            return None
         try:
-            result = convertStd(source, target)
-        except:
-            result = source
-        return result
+            with open(self.cache_file) as cache:
+                station = json.load(cache)
+        except (IOError, ValueError) as e:
+            logdbg('No weather station details cached: {0}'.format(e))
+            return None
+        if not isinstance(station, dict):
+            logdbg('No weather station details cached: {0} does not hold an object'.format(
+                self.cache_file))
+            return None
+        return station
+
+    def writeStationCache(self):
+        """Save the details of the weather station so that the next connection
+        can be made without having to search for it"""
+        station = {'name': self.ws_name,
+                   'mac_address': self.ws_MAC_address,
+                   'ip_address': self.ws_IP_address}
+        if self.cache_file is None or station == self.station_cache:
+            return
+        try:
+            with open(self.cache_file, 'w') as cache:
+                json.dump(station, cache)
+            self.station_cache = station
+        except IOError as e:
+            loginf('Could not save the weather station details: {0}'.format(e))
 
     def connectToWeatherStation(self, reconnect=False):
         network_retry_count = self.max_retry   # Local network failure retry counter
+        cached_address = None
+        if self.station_cache is not None:
+            cached_address = self.station_cache.get('ip_address')
         while self.ws_socket is None:
             # Search for a weather station on the specified subnet
             if not self.internal_test_mode:
-                # Broadcast for a weather station
-                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
-                                     socket.IPPROTO_UDP)
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-                sock.settimeout(self.socket_timeout)
-                bcData = b"PC2000\0\0SEARCH\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0"
-                retry_counter = self.retry_count
-                sender_addr = None
-                while True:
-                    try:
-                        sock.sendto(bcData,
-                                    (self.ip_address_mask, UDP_BROADCAST_PORT))
-                    except socket.error:
-                        network_retry_count -= 1
-                        if network_retry_count > 0:
-                            # Try accessing the network again after a short break
-                            time.sleep(self.retry_wait)
+                if cached_address is not None:
+                    # Try the weather station found last time before searching for it
+                    self.ws_socket = self.connectDirect(cached_address)
+                    cached_address = None    # Only try this once
+                if self.ws_socket is None:
+                    # Broadcast for a weather station
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                                         socket.IPPROTO_UDP)
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+                    sock.settimeout(self.socket_timeout)
+                    bcData = b"PC2000\0\0SEARCH\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0\0"
+                    retry_counter = self.retry_count
+                    sender_addr = None
+                    while True:
+                        try:
+                            sock.sendto(bcData,
+                                        (self.ip_address_mask, UDP_BROADCAST_PORT))
+                        except socket.error:
+                            network_retry_count -= 1
+                            if network_retry_count > 0:
+                                # Try accessing the network again after a short break
+                                self.retryWait(self.max_retry - network_retry_count)
+                                break
+                            else:
+                                # Run out of attempts
+                                raise weewx.RetriesExceeded
+                        try:
+                            # Receive the response form the weather station
+                            data, sender_addr = sock.recvfrom(512)
                             break
-                        else:
-                            # Run out of attempts
-                            raise weewx.RetriesExceeded
-                    try:
-                        # Receive the response form the weather station
-                        data, sender_addr = sock.recvfrom(512)
-                        break
-                    except socket.timeout:
-                        retry_counter -= 1
-                        if retry_counter == 0:
+                        except socket.timeout:
+                            retry_counter -= 1
+                            if retry_counter == 0:
+                                sender_addr = None
+                                loginf('Timed out too many times')
+                                break
+                        except socket.error:
+                            network_retry_count -= 1
+                            if network_retry_count > 0:
+                                # Try accessing the network again after a short break
+                                self.retryWait(self.max_retry - network_retry_count)
+                                break
+                            else:
+                                # Run out of attempts
+                                raise weewx.RetriesExceeded
+                        except Exception as e:
                             sender_addr = None
-                            loginf('Timed out too many times')
+                            loginf('Unknown error: {0}'.format(e))
                             break
-                    except socket.error:
-                        network_retry_count -= 1
-                        if network_retry_count > 0:
-                            # Try accessing the network again after a short break
-                            time.sleep(self.retry_wait)
-                            break
-                        else:
-                            # Run out of attempts
-                            raise weewx.RetriesExceeded
-                    except Exception as e:
-                        sender_addr = None
-                        loginf('Unknown error: {0}'.format(e))
-                        break
-                sock.close()
-
-                # make sure we found something
-                if sender_addr is None:
-                    continue
+                    sock.close()
 
-                # Get the data sent back by the weather station
-                self.ws_name = data[0:8].decode().rstrip('\0')
-                self.ws_MAC_address = data[40:64].decode().rstrip('\0')
-                self.ws_IP_address = data[64:80].decode().rstrip('\0')
-
-                # Connect to the weather station
-                self.ws_socket = None
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                sock.settimeout(self.socket_timeout)
-                try:
-                    sock.bind(("0.0.0.0", TCP_PORT))
-                except socket.error:
-                    network_retry_count -= 1
-                    if network_retry_count > 0:
-                        sock.close()
-                        # Try accessing the network again after a short break
-                        time.sleep(self.retry_wait)
+                    # make sure we found something
+                    if sender_addr is None:
+                        continue
+                    if len(data) < 80:
+                        loginf('Ignoring a short reply from {0}'.format(sender_addr))
                         continue
-                    else:
-                        # Run out of attempts
-                        raise weewx.RetriesExceeded
 
-                while True:
-                    sock.listen(5)
+                    # Get the data sent back by the weather station
+                    self.ws_name = _decode_field(data[0:8])
+                    self.ws_MAC_address = _decode_field(data[40:64])
+                    self.ws_IP_address = _decode_field(data[64:80])
+
+                    # Connect to the weather station
+                    self.ws_socket = None
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                    sock.settimeout(self.socket_timeout)
+                    listening = True
                     try:
-                        # Wait until we are talked to (or timeout)
-                        (self.ws_socket, address) = sock.accept()
-                        loginf('Connected to address {0}'.format(address))
-                        self.ws_socket.setblocking(0)
-                        self.ws_socket.settimeout(self.socket_timeout)
-                        break
-                    except socket.timeout:
-                        retry_counter -= 1
-                        if retry_counter == 0:
-                            self.ws_socket = None
-                            break
+                        sock.bind(("0.0.0.0", TCP_PORT))
+                        sock.listen(5)
                     except socket.error:
+                        listening = False
+
+                    # Connecting to the weather station saves waiting for it to call
+                    # back if it accepts connections. Listening first means that the
+                    # call back is not missed if it doesn't
+                    self.ws_socket = self.connectDirect(self.ws_IP_address)
+                    if self.ws_socket is None and not listening:
                         network_retry_count -= 1
                         if network_retry_count > 0:
+                            sock.close()
                             # Try accessing the network again after a short break
-                            time.sleep(self.retry_wait)
-                            break
+                            self.retryWait(self.max_retry - network_retry_count)
+                            continue
                         else:
                             # Run out of attempts
                             raise weewx.RetriesExceeded
-                    except Exception as e:
-                        self.ws_socket = None
-                        loginf('Listening error: {0}'.format(e))
-                        break
-                sock.close()
 
-                # Make sure that we are talking to a weather station
-                if self.ws_socket is None:
-                    continue
+                    while self.ws_socket is None:
+                        try:
+                            # Wait until we are talked to (or timeout)
+                            (self.ws_socket, address) = sock.accept()
+                            loginf('Connected to address {0}'.format(address))
+                            self.configureSocket(self.ws_socket)
+                            break
+                        except socket.timeout:
+                            retry_counter -= 1
+                            if retry_counter == 0:
+                                self.ws_socket = None
+                                break
+                        except socket.error:
+                            network_retry_count -= 1
+                            if network_retry_count > 0:
+                                # Try accessing the network again after a short break
+                                self.retryWait(self.max_retry - network_retry_count)
+                                break
+                            else:
+                                # Run out of attempts
+                                raise weewx.RetriesExceeded
+                        except Exception as e:
+                            self.ws_socket = None
+                            loginf('Listening error: {0}'.format(e))
+                            break
+                    sock.close()
+
+                    # Make sure that we are talking to a weather station
+                    if self.ws_socket is None:
+                        continue
+                    self.writeStationCache()
 
                 # See if this is not a reconnect
                 if not reconnect:
@@ -435,47 +674,53 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
                         network_retry_count -= 1
                         if network_retry_count > 0:
                             # Try accessign the network again after a short break
-                            time.sleep(self.retry_wait)
+                            self.retryWait(self.max_retry - network_retry_count)
                             continue
                         else:
                             # Run out of attempts
                             raise weewx.RetriesExceeded
                     try:
-                        rxData = self.ws_socket.recv(1024)
+                        rxData = self.recvPacket(_SETUP_PACKET_SIZE)
+                    except StationPacketError as e:
+                        loginf(str(e))
+                        self.closeConnection()
+                        network_retry_count -= 1
+                        if network_retry_count > 0:
+                            # Try again after a short break - reconnecting resynchronises the stream
+                            self.retryWait(self.max_retry - network_retry_count)
+                            continue
+                        else:
+                            # Run out of attempts
+                            raise weewx.RetriesExceeded
                     except:
-                        self.ws_socket.close()
-                        self.ws_socket = None
+                        self.closeConnection()
                         continue
 
                     # Interpret the data
-                    interp_data = struct.unpack("8s8s8s8s8s15b", rxData)
-                    # The fields are:
-                    #   [0] - The device ID
-                    #   [1] - The command (WRITE)
-                    #   [2] - The argument (SETUP)
-                    #   [3] - some part of the command that is echoed
-                    #   [4] - some response that overlaps the command and is not yet understood
-                    #   [5] - Time format (1 = 'H:mm:ss', 2 = 'h:mm:ss AM', 4 = 'AM h:mm:ss')
-                    #   [6] - Date format (16 = 'DD-MM-YYYY', 32 = 'MM-DD-YYYY', 64 = 'YYYY-MM-DD')
-                    #   [7] - Temperature unit (0 = Celsius, 1 = Fahrenheit)
-                    #   [8] - Pressure Unit (0 = hPa, 1 = inHg, 2 = mmHg)
-                    #   [9] - Wind speed (0=m/s, 1=km/h, 2=knot, 3=mph, 4=bft, 5=ft/s)
-                    #   [10]- Rainfall unit (0 = mm, 1 = in)
-                    #   [11]- Solar Radiation (0=lux, 1=fc, 2=W/m^2)
-                    #   [12]- Rain display (0=rain rate,1=daily, 2-weekly, 3=monthly, 4=yearly)
-                    #   [13]- Graph Time (0=12h, 1=24h, 2=48h, 3=72h)
-                    #   [14]- Barometer display (0=Abs, 1=Rel)
-                    #   [15]- Weather Threshold (number)
-                    #   [16]- Storm Threshold (number)
-                    #   [17]- Current Weather (0=Sun, 1=partly cloudy, 2=cloudy, 3=rain, 4=storm threshold)
-                    #   [18]- Rainfall reset month (1=January...)
-                    #   [19]- Update interval (number, minutes)
+                    interp_data = _SETUP_PAYLOAD.unpack_from(rxData, _PAYLOAD_OFFSET)
+                    # The fields (after the header) are:
+                    #   [0] - Time format (1 = 'H:mm:ss', 2 = 'h:mm:ss AM', 4 = 'AM h:mm:ss')
+                    #   [1] - Date format (16 = 'DD-MM-YYYY', 32 = 'MM-DD-YYYY', 64 = 'YYYY-MM-DD')
+                    #   [2] - Temperature unit (0 = Celsius, 1 = Fahrenheit)
+                    #   [3] - Pressure Unit (0 = hPa, 1 = inHg, 2 = mmHg)
+                    #   [4] - Wind speed (0=m/s, 1=km/h, 2=knot, 3=mph, 4=bft, 5=ft/s)
+                    #   [5] - Rainfall unit (0 = mm, 1 = in)
+                    #   [6] - Solar Radiation (0=lux, 1=fc, 2=W/m^2)
+                    #   [7] - Rain display (0=rain rate,1=daily, 2-weekly, 3=monthly, 4=yearly)
+                    #   [8] - Graph Time (0=12h, 1=24h, 2=48h, 3=72h)
+                    #   [9] - Barometer display (0=Abs, 1=Rel)
+                    #   [10]- Weather Threshold (number)
+                    #   [11]- Storm Threshold (number)
+                    #   [12]- Current Weather (0=Sun, 1=partly cloudy, 2=cloudy, 3=rain, 4=storm threshold)
+                    #   [13]- Rainfall reset month (1=January...)
+                    #   [14]- Update interval (number, minutes)
                     # We are interested in the temperature, pressure, wind speed, rainfall and solar radiation values
-                    self.temperature_unit = interp_data[7]
-                    self.pressure_unit = interp_data[8]
-                    self.wind_unit = interp_data[9]
-                    self.rain_unit = interp_data[10]
-                    self.solar_unit = interp_data[11]
+                    self.temperature_unit = interp_data[2]
+                    self.pressure_unit = interp_data[3]
+                    self.wind_unit = interp_data[4]
+                    self.rain_unit = interp_data[5]
+                    self.solar_unit = interp_data[6]
+                    self.set_unit_conversions()
 
                     # If we get here then we have established contact
                     loginf('Established contact at %s' %
@@ -488,6 +733,7 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
                 self.wind_unit = 0  # m/s
                 self.rain_unit = 0  # mm
                 self.solar_unit = 2  # w/m^2
+                self.set_unit_conversions()
                 self.rainfall_amount = 0
                 self.max_iterations = 2 * 3 * 6 * 2 * 3 * 2
                 self.iteration_count = 0
@@ -495,6 +741,10 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
 
     def genLoopPackets(self):
         network_retry_count = self.max_retry   # Local network failure retry counter
+        # Look these up once rather than for every packet
+        metricwx = weewx.METRICWX
+        payload_unpack = _NOW_PAYLOAD.unpack_from
+        sqrt = math.sqrt
         while True:
             # Make sure we are connected to the weather station
             # If we can't then this will raise an exception
@@ -512,99 +762,93 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
                     network_retry_count -= 1
                     if network_retry_count > 0:
                         # Try accessing the network again after a short break
-                        time.sleep(self.retry_wait)
-                        self.ws_socket.close()
-                        self.ws_socket = None
+                        self.retryWait(self.max_retry - network_retry_count)
+                        self.closeConnection()
                         continue
                     else:
                         # Run out of attempts
                         raise weewx.RetriesExceeded
                 try:
-                    rxData = self.ws_socket.recv(1024)
-                except:
-                    self.ws_socket.close()
-                    self.ws_socket = None
-                    continue
-                # Check for a mal-formed packet
-                try:
-                    interp_data = struct.unpack("8s8s16s8shbb14fbbh", rxData)
-                except struct.error as e:
+                    rxData = self.recvPacket(_NOW_PACKET_SIZE)
+                except StationPacketError as e:
+                    loginf(str(e))
+                    self.closeConnection()
                     network_retry_count -= 1
                     if network_retry_count > 0:
-                        time.sleep(self.retry_wait)
-                        self.ws_socket.close()
-                        self.ws_socket = None
+                        # Try again after a short break - reconnecting resynchronises the stream
+                        self.retryWait(self.max_retry - network_retry_count)
                         continue
                     else:
+                        # Run out of attempts
                         raise weewx.RetriesExceeded
+                except:
+                    self.closeConnection()
+                    continue
+                interp_data = payload_unpack(rxData, _PAYLOAD_OFFSET)
             else:
                 # Create test mode data
-                interp_data = [0] * 25
+                interp_data = [0] * 20
                 # Internal Test Mode
-                # interp_data[0] - device ID
-                # interp_data[1] - Command
-                # interp_data[2] - Argument
-                # interp_data[3] - junk (yet to be understood)
-                interp_data[4] = 95  # Wind direction in degrees
-                interp_data[5] = 49  # Inside humidity in percent
-                interp_data[6] = 71  # Outside humidity in percent
+                interp_data[0] = 95  # Wind direction in degrees
+                interp_data[1] = 49  # Inside humidity in percent
+                interp_data[2] = 71  # Outside humidity in percent
 
                 if self.temperature_unit == 0:
-                    interp_data[7] = 24.5  # inside temp in C
-                    interp_data[10] = 15.9  # outside temp in C
-                    interp_data[11] = 7.4  # dewpoint in C
-                    interp_data[12] = 15.8  # Windchill in C
+                    interp_data[3] = 24.5  # inside temp in C
+                    interp_data[6] = 15.9  # outside temp in C
+                    interp_data[7] = 7.4  # dewpoint in C
+                    interp_data[8] = 15.8  # Windchill in C
                 else:
-                    interp_data[7] = 24.5 * 9 / 5 + 32  # F
-                    interp_data[10] = 15.9 * 9 / 5 + 32
-                    interp_data[11] = 7.4 * 9 / 5 + 32
-                    interp_data[12] = 15.8 * 9 / 5 + 32
+                    interp_data[3] = 24.5 * 9 / 5 + 32  # F
+                    interp_data[6] = 15.9 * 9 / 5 + 32
+                    interp_data[7] = 7.4 * 9 / 5 + 32
+                    interp_data[8] = 15.8 * 9 / 5 + 32
 
                 if self.pressure_unit == 0:
-                    interp_data[8] = 1014.3  # Pressure in hPa
-                    interp_data[9] = 998.4  # Barometer in hPa
+                    interp_data[4] = 1014.3  # Pressure in hPa
+                    interp_data[5] = 998.4  # Barometer in hPa
                 elif self.pressure_unit == 1:
-                    interp_data[8] = 1014.3 * 0.02953  # Pressure in inHg
-                    interp_data[9] = 998.4 * 0.02953  # Barometer in inHg
+                    interp_data[4] = 1014.3 * 0.02953  # Pressure in inHg
+                    interp_data[5] = 998.4 * 0.02953  # Barometer in inHg
                 else:
-                    interp_data[8] = 1014.3 * 0.75006156  # Pressure in mmHg
-                    interp_data[9] = 998.4 * 0.75006156  # Barometer in mmHg
+                    interp_data[4] = 1014.3 * 0.75006156  # Pressure in mmHg
+                    interp_data[5] = 998.4 * 0.75006156  # Barometer in mmHg
 
                 if self.wind_unit == 0:
-                    interp_data[13] = 1.5  # Wind speed in m/s
-                    interp_data[14] = 3.8  # Wind gust in m/s
+                    interp_data[9] = 1.5  # Wind speed in m/s
+                    interp_data[10] = 3.8  # Wind gust in m/s
                 elif self.wind_unit == 1:
-                    interp_data[13] = 1.5 * 3.6  # Wind speed in km/hr
-                    interp_data[14] = 3.8 * 3.6  # Wind gust in km/hr
+                    interp_data[9] = 1.5 * 3.6  # Wind speed in km/hr
+                    interp_data[10] = 3.8 * 3.6  # Wind gust in km/hr
                 elif self.wind_unit == 2:
-                    interp_data[13] = 1.5 * 1.94384  # Wind speed in knots
-                    interp_data[14] = 3.8 * 1.94384  # Wind gust in knots
+                    interp_data[9] = 1.5 * 1.94384  # Wind speed in knots
+                    interp_data[10] = 3.8 * 1.94384  # Wind gust in knots
                 elif self.wind_unit == 3:
-                    interp_data[13] = 1.5 * 2.23694  # Wind speed in mph
-                    interp_data[14] = 3.8 * 2.23694  # Wind gust in mph
+                    interp_data[9] = 1.5 * 2.23694  # Wind speed in mph
+                    interp_data[10] = 3.8 * 2.23694  # Wind gust in mph
                 elif self.wind_unit == 4:
                     # Formula taken from https://en.wikipedia.org/wiki/Beaufort_scale
                     # and inverted for a rough approximation
-                    interp_data[13] = int(round(math.pow(1.5 / 0.836, 2.0 / 3.0)))
-                    interp_data[14] = int(round(math.pow(3.8 / 0.836, 2.0 / 3.0)))
+                    interp_data[9] = int(round(math.pow(1.5 / 0.836, 2.0 / 3.0)))
+                    interp_data[10] = int(round(math.pow(3.8 / 0.836, 2.0 / 3.0)))
                 else:
-                    interp_data[13] = 1.5 * 3.28084  # Wind speed in ft/s
-                    interp_data[14] = 3.8 * 3.28084  # Wind gust in fts
+                    interp_data[9] = 1.5 * 3.28084  # Wind speed in ft/s
+                    interp_data[10] = 3.8 * 3.28084  # Wind gust in fts
 
                 if self.solar_unit == 0:
-                    interp_data[20] = 532.7 / 4.02  # Sunlight in Lux
+                    interp_data[16] = 532.7 / 4.02  # Sunlight in Lux
                 elif self.solar_unit == 1:
-                    interp_data[20] = 532.7 / 0.04358  # Sunlight in fc
+                    interp_data[16] = 532.7 / 0.04358  # Sunlight in fc
                 else:
-                    interp_data[20] = 532.7  # w/m2
+                    interp_data[16] = 532.7  # w/m2
 
                 if self.rain_unit == 0:
-                    interp_data[16] = self.rainfall_amount  # Rain in mm
+                    interp_data[12] = self.rainfall_amount  # Rain in mm
                 else:
-                    interp_data[16] = self.rainfall_amount / 25.4  # Rain in inches
+                    interp_data[12] = self.rainfall_amount / 25.4  # Rain in inches
                 self.rainfall_amount += 0.1  # Heavy rain!!! - At least it will register
 
-                interp_data[21] = 3  # Actually the UVI
+                interp_data[17] = 3  # Actually the UVI
 
                 print('Temperature Unit: %d' % self.temperature_unit)
                 print('   Pressure Unit: %d' % self.pressure_unit)
@@ -614,144 +858,58 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
                 # End of loading up the test data
 
             # Build the LOOP packet from the data
-            _packet = {'dateTime': int(time.time()),
-                       'usUnits': weewx.METRICWX,
-                       'windDir': None if interp_data[4] == 32767 else interp_data[4],
-                       'inHumidity': interp_data[5],
-                       'outHumidity': None if interp_data[6] == 127 else interp_data[6]}
+            current_time = time.time()
+            _packet = {'dateTime': int(current_time),
+                       'usUnits': metricwx}
 
             # For units that are set by the console, convert them to metricwx if necessary
-            sourceUnit = ''
-            if self.temperature_unit == 0:
-                sourceUnit = 'degree_C'
-            else:
-                sourceUnit = 'degree_F'
-            if interp_data[7] == 32767:
-                _packet['inTemp'] = None
-            else:
-                _packet['inTemp'] = self.convert_units((interp_data[7], sourceUnit,
-                                                        'group_temperature'), weewx.METRICWX)[0]
-            if interp_data[10] >= 3276:
-                _packet['outTemp'] = None
-            else:
-                _packet['outTemp'] = self.convert_units((interp_data[10], sourceUnit,
-                                                         'group_temperature'), weewx.METRICWX)[0]
-            if interp_data[11] >= 3276:
-                _packet['dewPoint'] = None
-            else:
-                _packet['dewPoint'] = self.convert_units((interp_data[11], sourceUnit,
-                                                          'group_temperature'), weewx.METRICWX)[0]
-            if interp_data[12] >= 3276:
-                _packet['windChill'] = None
-            else:
-                _packet['windChill'] = self.convert_units((interp_data[12], sourceUnit,
-                                                           'group_temperature'), weewx.METRICWX)[0]
-
-            if self.pressure_unit == 0:
-                sourceUnit = 'hPa'
-            elif self.pressure_unit == 1:
-                sourceUnit = 'inHg'
-            else:
-                sourceUnit = 'mmHg'
-            if interp_data[8] >= 3276:
-                _packet['pressure'] = None
-            else:
-                _packet['pressure'] = self.convert_units((interp_data[8], sourceUnit,
-                                                          'group_pressure'), weewx.METRICWX)[0]
-            if interp_data[9] >= 3276:
-                _packet['pressure'] = None
-            else:
-                _packet['barometer'] = self.convert_units((interp_data[9], sourceUnit,
-                                                           'group_pressure'), weewx.METRICWX)[0]
-
-            if self.wind_unit == 0:
-                sourceUnit = 'meter_per_second'
-            elif self.wind_unit == 1:
-                sourceUnit = 'km_per_hour'
-            elif self.wind_unit == 2:
-                sourceUnit = 'knot'
-            elif self.wind_unit == 3:
-                sourceUnit = 'mile_per_hour'
-            elif self.wind_unit == 4:
-                loginf('Beaufort Wind Scale Used - Using Approximation')
-                interp_data = list(interp_data)  # Convert to a list so we can alter the values
-                sourceUnit = 'meter_per_second'  # Used so there will be no scale factor applied
+            for key, index, limit, scale, offset in self._field_spec:
+                value = interp_data[index]
+                _packet[key] = None if value >= limit else value * scale + offset
+            # Only set up when the wind is in Beaufort
+            for key, index, limit in self._beaufort_spec:
                 # Formula taken from https://en.wikipedia.org/wiki/Beaufort_scale
-                interp_data[13] = 0.836 * math.pow(interp_data[13], 1.5)
-                interp_data[14] = 0.836 * math.pow(interp_data[14], 1.5)
-            else:
-                sourceUnit = 'meter_per_second'  # Used so no scale factor will be applied
-                interp_data = list(interp_data)  # Convert to a list so we can alter the values
-                interp_data[13] *= 0.3048  # ft/s to m/s
-                interp_data[14] *= 0.3048
-            if interp_data[13] >= 3276:
-                _packet['windSpeed'] = None
-            else:
-                _packet['windSpeed'] = self.convert_units((interp_data[13], sourceUnit,
-                                                           'group_speed'), weewx.METRICWX)[0]
-            if interp_data[14] >= 3276:
-                _packet['windGust'] = None
-            else:
-                _packet['windGust'] = self.convert_units((interp_data[14], sourceUnit,
-                                                          'group_speed'), weewx.METRICWX)[0]
-
-            # Weewx does not have a standard for Lux of foot-candles
-            if interp_data[20] > 2147480:
-                _packet['radiation'] = None
-            elif self.solar_unit == 0:
-                _packet['radiation'] = interp_data[20] * 4.02  # Lux to w/m2 for sunlight
-            elif self.solar_unit == 1:
-                # fc to photons *0.199) to w/m2 (0.219)
-                _packet['radiation'] = interp_data[20] * 0.04358
-            else:
-                _packet['radiation'] = interp_data[20]
-            if interp_data[21] < 0:
+                # (x * sqrt(x) is x^1.5 without the general power function)
+                value = interp_data[index]
+                value = 0.836 * value * sqrt(value)
+                _packet[key] = None if value >= limit else value
+
+            if interp_data[17] < 0:
                 _packet['UV'] = None
             else:
-                _packet['UV'] = interp_data[21]  # Actually the UVI
+                _packet['UV'] = interp_data[17]  # Actually the UVI
 
-            current_time = datetime.datetime.now()
+            # The weather station resets the daily rain at local midnight
+            current_day = time.localtime(current_time).tm_yday
             if self.last_rain_value is None:
                 # Should be the first time through
                 _packet['rain'] = None
             else:
                 # Regular path
-                if interp_data[16] >= 214748367:
+                if interp_data[12] >= 214748367:
                     _packet['rain'] = None
-                elif current_time.time() > self.last_rain_time.time() and \
-                        interp_data[16] >= self.last_rain_value:
+                elif current_day == self.last_rain_day and \
+                        interp_data[12] >= self.last_rain_value:
                     # Still in the same day as the previous loop and
                     # the rain value is not lower now than the last reading
-                    if self.rain_unit == 0:
-                        _packet['rain'] = interp_data[16] - self.last_rain_value
-                    else:
-                        _packet['rain'] = (interp_data[16] -
-                                           self.last_rain_value) * 25.4  # in to mm
+                    _packet['rain'] = (interp_data[12] -
+                                       self.last_rain_value) * self._rain_to_mm[0]
                 else:
                     # We have started a new day or the rain value has (somehow) gone down
                     # without a 'new day reset' in the weather station
                     _packet['rain'] = 0.0
-            self.last_rain_value = interp_data[16]
-            self.last_rain_time = current_time
+            self.last_rain_value = interp_data[12]
+            self.last_rain_day = current_day
             # Leave 'rainRate' to be calculated by wxservice
 
             if self.internal_test_mode:
                 # Increment the various units, wrapping around as necessary
-                self.temperature_unit += 1
-                if self.temperature_unit > 1:
-                    self.temperature_unit = 0
-                self.pressure_unit += 1
-                if self.pressure_unit > 2:
-                    self.pressure_unit = 0
-                self.wind_unit += 1
-                if self.wind_unit > 5:
-                    self.wind_unit = 0
-                self.solar_unit += 1
-                if self.solar_unit > 2:
-                    self.solar_unit = 0
-                self.rain_unit += 1
-                if self.rain_unit > 1:
-                    self.rain_unit = 0
+                self.temperature_unit = (self.temperature_unit + 1) % 2
+                self.pressure_unit = (self.pressure_unit + 1) % 3
+                self.wind_unit = (self.wind_unit + 1) % 6
+                self.solar_unit = (self.solar_unit + 1) % 3
+                self.rain_unit = (self.rain_unit + 1) % 2
+                self.set_unit_conversions()
 
                 self.iteration_count += 1
                 if self.iteration_count > self.max_iterations:
@@ -768,75 +926,249 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
         self.internal_test_mode = new_state
 
 
-    def recvWithTimeout( self, sock, size):
-        ready = select.select( [sock], [], [], 1.0)
-        if ready[0]:
-            data = sock.recv(size)
-        else:
-            data = None
-        return data
-
-    def getHistoryData(self, year, record_count, starting_record):
-        # Build the command packet
-        cmd_packet = struct.pack('8s8s16s2i2hi',
-                                 b'PC2000', b'READ', b'HISTORY_DATA',
-                                 48, record_count * 60 + 40,
-                                 year, record_count, starting_record)
-        try:
-            self.ws_socket.send(cmd_packet)
-        except IOError as e:
-            # Pipe broken - Weather station has shut down the link as nothing happening for too long
-            self.ws_socket = None
-            self.connectToWeatherStation(True)
-        rx_data = None
-        while rx_data is None:
+    def recvPacket(self, size):
+        """Read a response packet of a known size into the receive buffer.
+        TCP can deliver the packet in several segments so keep reading until
+        all of it has arrived.
+        Returns a view of the packet in the buffer which is only valid until
+        the next packet is received"""
+        rx_view = self._rx_view
+        received = 0
+        while received < size:
+            if not self._selector.select(self.socket_timeout):
+                raise socket.timeout('No response from the weather station')
+            count = self.ws_socket.recv_into(rx_view[received:size], size - received)
+            if count == 0:
+                raise StationPacketError('Connection closed by the weather station')
+            received += count
+        if rx_view[8:13] != b'WRITE':
+            # Not the response we are expecting
+            raise StationPacketError('Mal-formed packet from the weather station')
+        return rx_view[:size]
+
+    def recvWithTimeout(self, buffer):
+        """Read whatever has arrived into the buffer, waiting up to the socket
+        timeout for it. Returns the number of bytes read"""
+        if not self._selector.select(self.socket_timeout):
+            raise socket.timeout('No response from the weather station')
+        count = self.ws_socket.recv_into(buffer)
+        if count == 0:
+            raise StationPacketError('Connection closed by the weather station')
+        return count
+
+    def create_history_cmd(self, year, record_count, starting_record):
+        # Build the HISTORY_DATA command packet
+        cmd_packet = bytearray(_HISTORY_DATA_CMD)
+        _HISTORY_DATA_ARGS.pack_into(cmd_packet, _HISTORY_DATA_ARGS_OFFSET,
+                                     record_count * _HISTORY_RECORD.size + 40,
+                                     year, record_count, starting_record)
+        return cmd_packet
+
+    def requestHistoryData(self, cmd_packets, response_sizes):
+        """Send one or more HISTORY_DATA requests and read all of their responses,
+        given the largest size that each of the responses can be.
+        The responses are only matched to the requests by their order so if one of
+        them is not read completely, the rest cannot be trusted. In that case the
+        connection is reopened and all of the requests are sent again.
+        If the weather station does not answer requests sent together, they are
+        sent one at a time from then on"""
+        network_retry_count = self.max_retry   # Local network failure retry counter
+        cmd_size = len(_HISTORY_DATA_CMD)
+        while True:
             try:
-                rx_data = self.recvWithTimeout(self.ws_socket, record_count * 60 + 40)
-            except Exception as e:
-                # Something really bad
-                loginf(str(e))
-                raise weewx.RetriesExceeded
+                if self.history_pipeline > 1:
+                    self.ws_socket.sendall(cmd_packets)
+                    return [self.recvHistoryData(max_length) for max_length in response_sizes]
+                responses = []
+                for index, max_length in enumerate(response_sizes):
+                    self.ws_socket.sendall(cmd_packets[index * cmd_size:(index + 1) * cmd_size])
+                    responses.append(self.recvHistoryData(max_length))
+                return responses
+            except socket.error as e:
+                # Includes the weather station shutting down the link as nothing
+                # has happened for too long
+                loginf('History request failed: {0}'.format(e))
+                if isinstance(e, socket.timeout) and len(response_sizes) > 1 and \
+                        self.history_pipeline > 1:
+                    # The weather station may ignore requests that arrive while it is
+                    # busy - try again without counting this as a failure
+                    loginf('Sending history requests one at a time from now on')
+                    self.history_pipeline = 1
+                else:
+                    network_retry_count -= 1
+                    if network_retry_count <= 0:
+                        # Run out of attempts
+                        raise weewx.RetriesExceeded
+                    self.retryWait(self.max_retry - network_retry_count)
+                self.closeConnection()
+                self.connectToWeatherStation(True)
+
+    def recvHistoryData(self, max_length):
+        """Read one complete HISTORY_DATA response. The packet length is in the
+        header so read that first and then exactly the rest of the packet, leaving
+        any responses to pipelined requests in the socket.
+        The data is read straight into a buffer the size of the packet.
+        Raises socket.error if the whole packet does not arrive or the header is not
+        that of a HISTORY_DATA response no longer than 'max_length'"""
+        rx_data = bytearray(_HISTORY_HEADER_SIZE)
+        received = 0
+        while received < len(rx_data):
+            received += self.recvWithTimeout(memoryview(rx_data)[received:])
+            if received == _HISTORY_HEADER_SIZE:
+                # Get the length of the full returned packet
+                pkt_length = max(_PACKET_LENGTH.unpack_from(rx_data, 32)[0], _HISTORY_HEADER_SIZE)
+                if rx_data[8:13] != b'WRITE' or rx_data[16:28] != b'HISTORY_DATA' or \
+                        pkt_length > max_length:
+                    # Not the response we are expecting
+                    raise StationPacketError('Mal-formed history packet from the weather station')
+                # Read the rest of the packet into a buffer of its full size. The buffer
+                # is replaced rather than resized as it may still be in use by a view
+                packet = bytearray(pkt_length)
+                packet[:_HISTORY_HEADER_SIZE] = rx_data
+                rx_data = packet
 
-        # Get the length of the full returned packet
-        pkt_length = struct.unpack('I', rx_data[32:36])[0]
-        counter = 5
-        while len(rx_data) < pkt_length:
-            # the full packet is being send in small chunks
-            extra_data = self.recvWithTimeout( self.ws_socket, 1024)
-            if extra_data is not None:
-                rx_data += extra_data
+        return rx_data
+
+    def getHistoryData(self, year, record_count, starting_record):
+        return self.requestHistoryData(
+            self.create_history_cmd(year, record_count, starting_record),
+            [record_count * _HISTORY_RECORD.size + 40])[0]
+
+    def getHistoryRecords(self, year, record_numbers):
+        """Read single history records, sending all of the requests before
+        reading any of the responses so that the network round trips overlap.
+        The responses arrive in the same order as the requests"""
+        cmd_packets = bytearray(_HISTORY_DATA_CMD * len(record_numbers))
+        for index, record_number in enumerate(record_numbers):
+            _HISTORY_DATA_ARGS.pack_into(cmd_packets,
+                                         index * len(_HISTORY_DATA_CMD) + _HISTORY_DATA_ARGS_OFFSET,
+                                         _HISTORY_RECORD.size + 40, year, 1, record_number)
+        return self.requestHistoryData(cmd_packets,
+                                       [_HISTORY_RECORD.size + 40] * len(record_numbers))
+
+    def localTimeToTimestamp(self, local_seconds):
+        """Convert a local time (in seconds since 1/1/1970) to a unix timestamp. The
+        offset from local time only changes on the hour (or half hour) so the timestamp
+        of the start of the half hour is looked up once and the seconds into it are added"""
+        half_hour = local_seconds - local_seconds % 1800
+        if half_hour != self._timestamp_half_hour:
+            # Let mktime work out whether daylight saving applies
+            self._half_hour_timestamp = time.mktime(time.gmtime(half_hour)[:8] + (-1,))
+            self._timestamp_half_hour = half_hour
+        return self._half_hour_timestamp + (local_seconds - half_hour)
+
+    def findStartRecord(self, year, record_count, start_time):
+        """Find the index of the first history record for the year with a time after
+        'start_time' (local time in seconds since 1/1/1970), and the daily rain value
+        of the record before it.
+
+        Each record that is probed costs a network round trip so rather than
+        probing one record at a time, 'history_pipeline' requests are sent
+        together and the records they return split the remaining range.
+
+        The records are normally evenly spaced in time so once the date of the
+        record before the range is known, some of the probes go where the start
+        time is estimated to be (an interpolation search). The rest are spread
+        evenly across the range (as a binary search would) so that gaps in the
+        records, such as when the console was turned off, cannot slow the search
+        down too much.
+
+        Once the range is small enough, all of it is read with a single request
+        and scanned"""
+        last_rain_value = 0
+        lower = 0               # All of the records before this are not after start_time
+        upper = record_count    # This and all later records are after start_time (or missing)
+        lower_time = None       # Time of the record before 'lower'
+        upper_time = None       # Time of the record at 'upper' (if it exists)
+        probe_round = 0
+        while lower < upper:
+            if upper - lower <= _HISTORY_BATCH_SIZE:
+                # Few enough records left to read all of them at once and scan
+                # through them rather than narrowing the range down any further
+                samples = range(lower, upper)
+                rec_packet = self.getHistoryData(year, upper - lower, lower)
+                responses = [(rec_packet, 40 + i * _HISTORY_RECORD.size)
+                             for i in range(upper - lower)]
             else:
-                counter -= 1
-                if counter == 0:
+                samples = set()
+                # With only one probe per round, alternate interpolating and bisecting
+                if lower_time is not None and (self.history_pipeline > 1 or probe_round % 2):
+                    if upper_time is not None:
+                        seconds_per_record = (upper_time - lower_time) / (upper - lower + 1)
+                    else:
+                        # Beyond the last record found so far - assume the archive interval
+                        seconds_per_record = self.archive_interval
+                    if seconds_per_record > 0:
+                        estimate = lower + int((start_time - lower_time) / seconds_per_record)
+                        samples.add(min(max(estimate, lower), upper - 1))
+                        if self.history_pipeline >= 4:
+                            # Probing the record before the estimate as well brackets the
+                            # start time straight away when the estimate is right
+                            samples.add(min(max(estimate - 1, lower), upper - 1))
+                if probe_round == 0 and self._start_record_hint is not None and \
+                        self._start_record_hint[0] == year:
+                    # Start from where the previous search ended. This is only used to
+                    # place the first probes so it does not matter if it is out of date
+                    hint = self._start_record_hint[1]
+                    samples.add(min(max(hint - 1, lower), upper - 1))
+                    if self.history_pipeline > 1:
+                        samples.add(min(max(hint, lower), upper - 1))
+                bisect_count = max(self.history_pipeline - len(samples), 0)
+                step = (upper - lower) / (bisect_count + 1)
+                samples.update(lower + int(step * (i + 1)) for i in range(bisect_count))
+                samples = sorted(samples)
+                responses = [(rec_data, 40) for rec_data in self.getHistoryRecords(year, samples)]
+            probe_round += 1
+
+            for sample, (rec_data, offset) in zip(samples, responses):
+                if len(rec_data) < offset + 40:
+                    # We have asked for a record that does not exist
+                    upper = sample
+                    upper_time = None
                     break
 
-        return rx_data
+                # Extract the timestamp from the first 4 words
+                # The value is 100nSec since 1/1/1601!!!!
+                record_time = _station_local_time(_HISTORY_TIMESTAMP.unpack_from(rec_data, offset)[0])
+                if record_time > start_time:
+                    upper = sample
+                    upper_time = record_time
+                    break
+
+                # While we have the data, also record the records daily rain
+                lower = sample + 1
+                lower_time = record_time
+                last_rain_value = _HISTORY_RAIN.unpack_from(rec_data, offset + 36)[0] / 10.0
+
+        self._start_record_hint = (year, lower)
+        return lower, last_rain_value
 
-    
     def genStartupRecords(self, lastTimestamp):
         # Start by making sure we can access the weather station
         # If we can't then the function will raise an exception
         self.connectToWeatherStation()
         loginf("Retrieving startup records")
 
+        # Look these up once rather than for every record
+        metricwx = weewx.METRICWX
+        history_fields = _HISTORY_FIELDS
+        to_timestamp = self.localTimeToTimestamp
+
         year_index = 0
         while year_index >= 0:
             # Find out what data is available from the weather station
             try:
-                cmd_packet = struct.pack('8s8s16s2i',
-                                         b'PC2000', b'READ', b'HISTORY_FILE',
-                                         40, 0)
-                self.ws_socket.send(cmd_packet)
-                rxData = self.ws_socket.recv(1024)
+                self.ws_socket.send(_HISTORY_FILE_CMD)
+                rxData = self.recvPacket(_HISTORY_FILE.size)
             except Exception as e:
                 loginf(str(e))
                 raise weewx.RetriesExceeded
-            interp_data = struct.unpack('8s8s16s4h8H8I', rxData)
-            year_count = (struct.unpack('h', rxData[32:34])[0] - 40)//6 #packet size less the header
+            interp_data = _HISTORY_FILE.unpack_from(rxData)
+            year_count = (interp_data[3] - 40)//6 #packet size less the header
             year_data = []
             for i in range(year_count):
-                year_number = struct.unpack('H', rxData[40+i*2:42+i*2])[0]
-                record_count = struct.unpack('I', rxData[40+year_count*2 + i * 4:44 + year_count * 2 + i * 4])[0]
+                year_number = _HISTORY_YEAR.unpack_from(rxData, 40 + i * 2)[0]
+                record_count = _HISTORY_RECORD_COUNT.unpack_from(rxData, 40 + year_count * 2 + i * 4)[0]
                 if 0 == record_count:
                     # Calculate how many entries there could be this year
                     day_count = datetime.datetime.now().timetuple().tm_yday
@@ -845,9 +1177,8 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
             
             # Look to see if we have data for the year we are interested in
             year_index = None
-            epoch = datetime.datetime(1601, 1, 1)
             last_rain_value = 0
-            last_record_date = None
+            last_record_time = None     # Local time in seconds since 1/1/1970
             if lastTimestamp is None:
                 # Special case - we are starting from an empty database
                 # Therefore find the first year with data (i.e. the 'year' is not 0)
@@ -855,11 +1186,11 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
                 year = year_data[year_index][0]
                 start_record = 0
             else:
-                start_date = datetime.datetime.fromtimestamp(lastTimestamp)
-                last_record_date = start_date
+                start_date = time.localtime(lastTimestamp)
+                last_record_time = calendar.timegm(start_date)
                 for index, year_info in enumerate(year_data):
                     ws_year = year_info[0]
-                    if ws_year == start_date.year:
+                    if ws_year == start_date.tm_year:
                         # We have data for the required year
                         # Find the date of the first record for this year
                         year_index = index
@@ -871,54 +1202,12 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
                     return
 
                 # Find the record number of the first record with a date after
-                # the start_date using a binary search
+                # the start time
                 year = year_data[year_index][0]
-                lower = 0
-                upper = year_data[year_index][1]
-
-                while True:
-                    if lower == upper:
-                        # the lower and upper indicies are the same
-                        sample = upper
-                        break
-                    sample = (upper + lower) // 2
-                    # Read the data with the 'sample' record number
-                    # This might be a slow way as it takes time for the
-                    # weather station to respond. The alternative is to read
-                    # multiple records at a time but in the early stages of the binary
-                    # search, the records are a long way apart so there is little gain
-                    rec_data = self.getHistoryData(year, 1, sample)
-                    
-                    if len(rec_data) < 80:
-                        # We have asked for a record that does not exist
-                        upper = sample - 1
-                        continue
-
-                    # Extract the timestamp from the first 4 words
-                    # The value is 100nSec since 1/1/1601!!!!
-                    record_datetime = struct.unpack('Q', rec_data[40:48])[0] / 10.0  # uSec
-                    record_datetime = epoch + \
-                        datetime.timedelta(microseconds=record_datetime)
-
-                    # While we have the data, also record the records daily rain
-                    last_rain_value = struct.unpack('i', rec_data[76:80])[0] / 10.0
+                start_record, last_rain_value = self.findStartRecord(
+                    year, year_data[year_index][1], last_record_time)
 
-                    if start_date == record_datetime:
-                        # The values are the same - return sample index + 1
-                        sample += 1
-                        break
-                    if start_date > record_datetime:
-                        if lower == sample:
-                            sample += 1     # Go for the next entry
-                            break
-                        lower = sample + 1
-                    else:
-                        if upper == sample:
-                            break
-                        upper = sample
-                start_record = sample
-
-            # Sample will be the record number of the first record with the
+            # start_record will be the record number of the first record with the
             # *NEXT* record to pass back.
             # Exception - if the target date is later than the last record
             # then we are pointed to that last record index
@@ -936,51 +1225,38 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
             while year_index >= 0:
                 year = year_data[ year_index][0]
                 year_record_count = year_data[year_index][1]
-                record_count = 16
+                record_count = _HISTORY_BATCH_SIZE
                 if record_count + start_record >= year_record_count:
                     record_count = year_record_count - start_record - 1
                 if record_count > 0:
                     rec_packet = self.getHistoryData(year, record_count, start_record)
-                    rec_index = 40      # Skip the header data
-                    base = start_record
                     start_record += record_count
-                    while record_count > 0:
-                        rec_data = struct.unpack('Q12h7I',
-                                                 rec_packet[rec_index:rec_index + 60])
+                    # Skip the header data and decode all of the records in one go
+                    for rec_data in _HISTORY_RECORD.iter_unpack(
+                            memoryview(rec_packet)[40:40 + record_count * _HISTORY_RECORD.size]):
                         # Note: the values in the HISTORY_DATA record always seem to be
                         # metric, regardless of the setup options
                         # Please let me know if this is NOT THE CASE
-                        _packet = {'usUnits': weewx.METRICWX}
-                        rec_data = list(rec_data)
+                        _packet = {'usUnits': metricwx}
 
-                        record_datetime = epoch + \
-                            datetime.timedelta(microseconds=rec_data[0] / 10.0)
-                        if last_record_date is not None and record_datetime <= last_record_date:
-                            record_count = 0
+                        record_time = _station_local_time(rec_data[0])
+                        if last_record_time is not None and record_time <= last_record_time:
                             year_index = -1
-                            record_datetime = last_record_date
                             break
-                        _packet['dateTime'] = time.mktime(record_datetime.timetuple())
-                        _packet['inTemp'] = None if rec_data[1] == 32767 else rec_data[1] / 10.0
-                        _packet['inHumidity'] = None if rec_data[2] == 32767 else rec_data[2]
-                        _packet['pressure'] = None if rec_data[3] == 32767 else rec_data[3] / 10.0
-                        _packet['barometer'] = None if rec_data[4] == 32767 else rec_data[4] / 10.0
-                        _packet['outTemp'] = None if rec_data[5] == 32767 else rec_data[5] / 10.0
-                        _packet['outHumidity'] = None if rec_data[6] == 127 else rec_data[6]
-                        _packet['dewPoint'] = None if rec_data[7] == 32767 else rec_data[7] / 10.0
-                        _packet['windchill'] = None if rec_data[8] == 32767 else rec_data[8] / 10.0
-                        # rec_data[9] / 10.0 might be 'heatIndex'
-                        _packet['windSpeed'] = None if rec_data[10] == 32767 else rec_data[10] / 10.0
-                        _packet['windGust'] = None if rec_data[11] == 32767 else rec_data[11] / 10.0
-                        _packet['windDir'] = None if rec_data[12] == 32767 else rec_data[12]
-                        # rec_data[13] is the 'rain rate'
+                        _packet['dateTime'] = to_timestamp(record_time)
+                        for key, index, no_data, divisor in history_fields:
+                            value = rec_data[index]
+                            if value == no_data:
+                                _packet[key] = None
+                            else:
+                                _packet[key] = value if divisor is None else value / divisor
 
                         # Calculate the 'delta rain' since the last record
                         # Reset on change of day
                         rain = None if rec_data[14] == 2147483647 else rec_data[14] / 10.0
-                        if last_record_date is None or rain is None or last_rain_value is None:
+                        if last_record_time is None or rain is None or last_rain_value is None:
                             _packet['rain'] = None
-                        elif last_record_date.time() > record_datetime.time() or \
+                        elif last_record_time // 86400 != record_time // 86400 or \
                                 last_rain_value > rain:
                             # start of a new day (or other cause for the rain to be lower than before)
                             _packet['rain'] = 0.0
@@ -994,8 +1270,6 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
 
                         _packet['UV'] = None if rec_data[18] == 32767 else int(
                             round(rec_data[18] / 250.0))   # Convert uW/cm2 to UVI
-                        # 126.7 lux/(w/m^2)
-                        _packet['radiation'] = None if rec_data[19] == 2147483647 else rec_data[19] / 1267.0
                         _packet['interval'] = 5
 
 # Comment this out if we are doing local testing.
@@ -1003,9 +1277,7 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
                         yield _packet
 
                         # Set up for the next record
-                        record_count -= 1
-                        rec_index += 60
-                        last_record_date = record_datetime
+                        last_record_time = record_time
 
                 # reached the end of this packet
                 if start_record >= year_record_count - 1:
@@ -1015,8 +1287,9 @@ class HP1000Driver(weewx.drivers.AbstractDevice):
 
             # Go around again and pick up the history records
             # that have been added since we started
-            lastTimestamp = time.mktime(record_datetime.timetuple())
-            print(f"Going aroung again - last timestamp: {record_datetime}")
+            if last_record_time is not None:
+                lastTimestamp = to_timestamp(last_record_time)
+                print(f"Going aroung again - last timestamp: {timestamp_to_string(lastTimestamp)}")
     
     @property
     def archive_interval(self):
@@ -1055,8 +1328,18 @@ class HP1000ConfEditor(weewx.drivers.AbstractConfEditor):
     max_retry = 3
 
     # Number of seconds to wait between attempts to access the network
+    # (doubled after each failed attempt, up to 30 seconds or retry_wait if that is longer)
     retry_wait = 5
 
+    # Number of history record requests to send at once when searching for
+    # the first record to retrieve at startup (1 sends them one at a time)
+    history_pipeline = 4
+
+    # File used to remember the weather station's address between runs so that
+    # the driver can connect to it without searching the network first
+    # Set to an empty value to always search for the weather station
+    cache_file = /var/lib/weewx/hp1000_cache.json
+
     # The driver to use:
     driver = user.HP1000
 """